@@ -0,0 +1,43 @@
+import json
+
+import redis
+
+ALERT_BUFFER_KEY = "alert_buffer"
+FLUSH_BATCH_SIZE = 500
+
+_redis = redis.Redis.from_url("redis://localhost:6379/0")
+
+
+def push_alert(user_id: int, geofence_id: int | None, message: str) -> None:
+    """
+    Queues an alert record in Redis instead of INSERT + COMMITing it
+    immediately. The flush_alerts beat task drains the buffer and writes
+    all pending records in one multi-row insert.
+    """
+    record = {
+        "user_id": user_id,
+        "geofence_id": geofence_id,
+        "message": message,
+    }
+    _redis.rpush(ALERT_BUFFER_KEY, json.dumps(record))
+
+
+def pop_alerts(limit: int = FLUSH_BATCH_SIZE) -> list[dict]:
+    """
+    Pops up to `limit` buffered alert records, oldest first. Returns an
+    empty list when the buffer is empty.
+    """
+    raw = _redis.lpop(ALERT_BUFFER_KEY, limit)
+    if not raw:
+        return []
+    return [json.loads(item) for item in raw]
+
+
+def requeue_alerts(records: list[dict]) -> None:
+    """
+    Puts popped records back on the buffer after a failed flush, so a brief
+    DB outage delays alerts instead of destroying them. They rejoin at the
+    tail; ordering within the buffer is not guaranteed across a requeue.
+    """
+    if records:
+        _redis.rpush(ALERT_BUFFER_KEY, *(json.dumps(record) for record in records))
@@ -1,9 +1,22 @@
+import sys
+
+# Monkey-patch the stdlib before requests/sqlalchemy are imported so sockets
+# become cooperative under the eventlet pool. Only patch inside the celery
+# worker process - the FastAPI app imports this module too (for .delay) and
+# must not be patched.
+if "celery" in sys.argv[0]:
+    import eventlet
+
+    eventlet.monkey_patch()
+
 from celery import Celery
+from celery.signals import task_postrun
+from sqlalchemy import insert, select
 from sqlalchemy.orm import Session
 
 from .database import SessionLocal
-from . import crud
-from .notifications import send_fcm_notification
+from . import alerts_buffer, models
+from .notifications import send_fcm_notifications_batch
 
 # Celery instance
 celery_app = Celery(
@@ -12,36 +25,95 @@ celery_app = Celery(
     backend="redis://localhost:6379/1",
 )
 
+# Bound the Redis connection pools: bursts of .delay() calls from the API
+# otherwise open an unbounded number of broker connections and can exhaust
+# Redis. acks_late + prefetch 1 keeps slow FCM tasks from hogging the queue.
+celery_app.conf.update(
+    broker_pool_limit=10,
+    broker_transport_options={
+        "max_connections": 20,
+        "socket_keepalive": True,
+    },
+    redis_max_connections=20,
+    task_acks_late=True,
+    worker_prefetch_multiplier=1,
+)
+
+# Drain the alert buffer every 100ms; run the worker with -B (see
+# run_celery.sh) so the embedded beat schedules it.
+celery_app.conf.beat_schedule = {
+    "flush-alerts": {
+        "task": "app.celery_app.flush_alerts",
+        "schedule": 0.1,
+    },
+}
+
 
 @celery_app.task
 def process_alert_task(user_id: int, geofence_id: int | None, message: str) -> None:
     """
     Background task to create an alert record and send push notifications.
     """
+    # 1. Buffer the alert record; flush_alerts batch-inserts it shortly after,
+    #    so bursty outages no longer cost one INSERT + COMMIT per user.
+    alerts_buffer.push_alert(user_id=user_id, geofence_id=geofence_id, message=message)
+
+    # 2. Fetch user's device tokens (sync session - the crud module is async
+    #    and belongs to the API; the worker keeps its own blocking queries)
+    db: Session = SessionLocal()
+    tokens = (
+        db.execute(select(models.Device.fcm_token).where(models.Device.user_id == user_id))
+        .scalars()
+        .all()
+    )
+    # Release the connection before the network phase: holding it through an
+    # up-to-15s FCM send across ~100 green threads would starve the sync pool.
+    SessionLocal.remove()
+
+    # 3. Send push notifications to all devices in one batch call
+    title = "Geofence Alert"
+    body = message
+    if tokens:
+        print(f"Sending FCM batch to user {user_id} ({len(tokens)} devices)...")
+        send_fcm_notifications_batch(
+            tokens=tokens,
+            title=title,
+            body=body,
+            data={
+                "user_id": user_id,
+                "geofence_id": geofence_id or 0,
+            },
+        )
+
+
+@celery_app.task
+def flush_alerts() -> int:
+    """
+    Beat task: drains up to 500 buffered alerts from Redis and writes them in
+    one multi-row INSERT. Returns the number of rows flushed.
+    """
+    records = alerts_buffer.pop_alerts()
+    if not records:
+        return 0
+
     db: Session = SessionLocal()
     try:
-        # 1. Create alert record
-        alert = crud.create_alert(db, user_id=user_id, geofence_id=geofence_id, message=message)
-
-        # 2. Fetch user's devices
-        devices = crud.get_devices_for_user(db, user_id=user_id)
-
-        # 3. Send push notification to each device
-        title = "Geofence Alert"
-        body = message
-
-        for device in devices:
-            print(f"Sending FCM to user {user_id} device {device.id}...")
-            send_fcm_notification(
-                token=device.fcm_token,
-                title=title,
-                body=body,
-                data={
-                    "alert_id": alert.id,
-                    "user_id": user_id,
-                    "geofence_id": geofence_id or 0,
-                },
-            )
-
-    finally:
-        db.close()
+        db.execute(insert(models.Alert), records)
+        db.commit()
+    except Exception:
+        # Put the batch back so a DB hiccup delays alerts instead of
+        # destroying them; the next beat tick retries.
+        alerts_buffer.requeue_alerts(records)
+        raise
+
+    return len(records)
+
+
+@task_postrun.connect
+def remove_session(*args, **kwargs) -> None:
+    """
+    Releases the green-thread-scoped session after every task so its
+    connection goes back to the pool (pool_pre_ping replaces any the server
+    closed in the meantime).
+    """
+    SessionLocal.remove()
@@ -1,135 +1,187 @@
-from sqlalchemy.orm import Session
-
-from . import models, schemas
-
-
-# ---------- USER CRUD ----------
-
-def create_user(db: Session, user: schemas.UserCreate) -> models.User:
-    db_user = models.User(username=user.username)
-    db.add(db_user)
-    db.commit()
-    db.refresh(db_user)
-    return db_user
-
-
-def get_user(db: Session, user_id: int) -> models.User | None:
-    return db.query(models.User).filter(models.User.id == user_id).first()
-
-
-# ---------- GEOFENCE CRUD ----------
-
-def create_geofence(db: Session, geofence: schemas.GeofenceCreate) -> models.Geofence:
-    db_geofence = models.Geofence(
-        user_id=geofence.user_id,
-        center_lat=geofence.center_lat,
-        center_lon=geofence.center_lon,
-        radius_m=geofence.radius_m,
-    )
-    db.add(db_geofence)
-    db.commit()
-    db.refresh(db_geofence)
-    return db_geofence
-
-
-def get_user_geofences(db: Session, user_id: int) -> list[models.Geofence]:
-    return db.query(models.Geofence).filter(models.Geofence.user_id == user_id).all()
-
-
-# ---------- LOCATION CRUD ----------
-
-def upsert_user_location(db: Session, location: schemas.LocationUpdate) -> models.UserLocation:
-    existing = (
-        db.query(models.UserLocation)
-        .filter(models.UserLocation.user_id == location.user_id)
-        .order_by(models.UserLocation.id.desc())
-        .first()
-    )
-
-    if existing:
-        existing.lat = location.lat
-        existing.lon = location.lon
-    else:
-        existing = models.UserLocation(
-            user_id=location.user_id,
-            lat=location.lat,
-            lon=location.lon,
-        )
-        db.add(existing)
-
-    db.commit()
-    db.refresh(existing)
-    return existing
-
-
-# ---------- ALERT CRUD ----------
-
-def create_alert(db: Session, user_id: int, geofence_id: int | None, message: str) -> models.Alert:
-    alert = models.Alert(
-        user_id=user_id,
-        geofence_id=geofence_id,
-        message=message,
-    )
-    db.add(alert)
-    db.commit()
-    db.refresh(alert)
-    return alert
-
-
-def get_alerts(db: Session, limit: int = 100) -> list[models.Alert]:
-    return (
-        db.query(models.Alert)
-        .order_by(models.Alert.created_at.desc())
-        .limit(limit)
-        .all()
-    )
-
-
-def get_alerts_for_user(db: Session, user_id: int, limit: int = 100) -> list[models.Alert]:
-    return (
-        db.query(models.Alert)
-        .filter(models.Alert.user_id == user_id)
-        .order_by(models.Alert.created_at.desc())
-        .limit(limit)
-        .all()
-    )
-
-
-# ---------- DEVICE CRUD ----------
-
-def register_device(db: Session, device: schemas.DeviceRegister) -> models.Device:
-    """
-    Simple upsert-like behavior:
-    - If a device with same fcm_token exists, update its user/platform.
-    - Else create a new row.
-    """
-    existing = db.query(models.Device).filter(models.Device.fcm_token == device.fcm_token).first()
-
-    if existing:
-        existing.user_id = device.user_id
-        existing.platform = device.platform
-        db.commit()
-        db.refresh(existing)
-        return existing
-
-    new_device = models.Device(
-        user_id=device.user_id,
-        platform=device.platform,
-        fcm_token=device.fcm_token,
-    )
-    db.add(new_device)
-    db.commit()
-    db.refresh(new_device)
-    return new_device
-
-
-def get_devices_for_user(db: Session, user_id: int) -> list[models.Device]:
-    return db.query(models.Device).filter(models.Device.user_id == user_id).all()
-
-def get_last_location_for_user(db: Session, user_id: int) -> models.UserLocation | None:
-    return (
-        db.query(models.UserLocation)
-        .filter(models.UserLocation.user_id == user_id)
-        .order_by(models.UserLocation.updated_at.desc())
-        .first()
-    )
\ No newline at end of file
+import math
+
+import pygeohash
+from sqlalchemy import func, select
+from sqlalchemy.dialects.mysql import insert as mysql_insert
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import selectinload
+
+from . import models, schemas
+from .spatial_index import GEOHASH_PRECISION
+
+
+# ---------- USER CRUD ----------
+
+async def create_user(db: AsyncSession, user: schemas.UserCreate) -> models.User:
+    db_user = models.User(username=user.username)
+    db.add(db_user)
+    await db.commit()
+    await db.refresh(db_user)
+    return db_user
+
+
+async def get_user(db: AsyncSession, user_id: int) -> models.User | None:
+    # Session.get checks the identity map first, so a user already loaded in
+    # this session costs no SELECT at all.
+    return await db.get(models.User, user_id)
+
+
+async def get_user_with_profile(db: AsyncSession, user_id: int) -> models.User | None:
+    """
+    Loads the user plus geofences, devices and locations via selectinload,
+    so the profile endpoint issues one batched query group instead of a
+    sequential SELECT per relationship.
+    """
+    return await db.get(
+        models.User,
+        user_id,
+        options=[
+            selectinload(models.User.geofences),
+            selectinload(models.User.devices),
+            selectinload(models.User.locations),
+        ],
+    )
+
+
+async def user_exists(db: AsyncSession, user_id: int) -> bool:
+    """
+    Cheap existence check for FK validation: selects only the id column
+    instead of hydrating a full User object.
+    """
+    result = await db.execute(select(models.User.id).where(models.User.id == user_id))
+    return result.scalar() is not None
+
+
+# ---------- GEOFENCE CRUD ----------
+
+async def create_geofence(db: AsyncSession, geofence: schemas.GeofenceCreate) -> models.Geofence:
+    phi = math.radians(geofence.center_lat)
+    db_geofence = models.Geofence(
+        user_id=geofence.user_id,
+        center_lat=geofence.center_lat,
+        center_lon=geofence.center_lon,
+        radius_m=geofence.radius_m,
+        sin_center_lat=math.sin(phi),
+        cos_center_lat=math.cos(phi),
+        geohash6=pygeohash.encode(
+            geofence.center_lat, geofence.center_lon, precision=GEOHASH_PRECISION
+        ),
+    )
+    db.add(db_geofence)
+    await db.commit()
+    await db.refresh(db_geofence)
+    return db_geofence
+
+
+async def get_user_geofences(db: AsyncSession, user_id: int) -> list[models.Geofence]:
+    result = await db.execute(
+        select(models.Geofence).where(models.Geofence.user_id == user_id)
+    )
+    return list(result.scalars().all())
+
+
+# ---------- LOCATION CRUD ----------
+
+async def upsert_user_location(db: AsyncSession, location: schemas.LocationUpdate) -> None:
+    """
+    Single-statement MySQL upsert. The unique index on user_locations.user_id
+    makes INSERT ... ON DUPLICATE KEY UPDATE land on the user's existing row,
+    replacing the old SELECT-then-UPDATE/INSERT pair (two round trips plus a
+    filesort on id) with one round trip. Raises IntegrityError if the user
+    does not exist, so callers can skip a separate existence check.
+    """
+    stmt = mysql_insert(models.UserLocation).values(
+        user_id=location.user_id,
+        lat=location.lat,
+        lon=location.lon,
+    )
+    stmt = stmt.on_duplicate_key_update(
+        lat=stmt.inserted.lat,
+        lon=stmt.inserted.lon,
+        updated_at=func.now(),
+    )
+    await db.execute(stmt)
+    await db.commit()
+
+
+# ---------- ALERT CRUD ----------
+
+async def create_alert(
+    db: AsyncSession, user_id: int, geofence_id: int | None, message: str
+) -> models.Alert:
+    alert = models.Alert(
+        user_id=user_id,
+        geofence_id=geofence_id,
+        message=message,
+    )
+    db.add(alert)
+    await db.commit()
+    await db.refresh(alert)
+    return alert
+
+
+async def get_alerts(db: AsyncSession, limit: int = 100) -> list[models.Alert]:
+    result = await db.execute(
+        select(models.Alert).order_by(models.Alert.created_at.desc()).limit(limit)
+    )
+    return list(result.scalars().all())
+
+
+async def get_alerts_for_user(
+    db: AsyncSession, user_id: int, limit: int = 100
+) -> list[models.Alert]:
+    result = await db.execute(
+        select(models.Alert)
+        .where(models.Alert.user_id == user_id)
+        .order_by(models.Alert.created_at.desc())
+        .limit(limit)
+    )
+    return list(result.scalars().all())
+
+
+# ---------- DEVICE CRUD ----------
+
+async def register_device(db: AsyncSession, device: schemas.DeviceRegister) -> models.Device:
+    """
+    Simple upsert-like behavior:
+    - If a device with same fcm_token exists, update its user/platform.
+    - Else create a new row.
+    """
+    result = await db.execute(
+        select(models.Device).where(models.Device.fcm_token == device.fcm_token)
+    )
+    existing = result.scalar_one_or_none()
+
+    if existing:
+        existing.user_id = device.user_id
+        existing.platform = device.platform
+        await db.commit()
+        await db.refresh(existing)
+        return existing
+
+    new_device = models.Device(
+        user_id=device.user_id,
+        platform=device.platform,
+        fcm_token=device.fcm_token,
+    )
+    db.add(new_device)
+    await db.commit()
+    await db.refresh(new_device)
+    return new_device
+
+
+async def get_devices_for_user(db: AsyncSession, user_id: int) -> list[models.Device]:
+    result = await db.execute(
+        select(models.Device).where(models.Device.user_id == user_id)
+    )
+    return list(result.scalars().all())
+
+
+async def get_last_location_for_user(db: AsyncSession, user_id: int) -> models.UserLocation | None:
+    result = await db.execute(
+        select(models.UserLocation)
+        .where(models.UserLocation.user_id == user_id)
+        .order_by(models.UserLocation.updated_at.desc())
+        .limit(1)
+    )
+    return result.scalar_one_or_none()
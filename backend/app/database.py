@@ -1,5 +1,18 @@
+import os
+
+from dotenv import load_dotenv
 from sqlalchemy import create_engine
-from sqlalchemy.orm import sessionmaker, declarative_base
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
+from sqlalchemy.orm import scoped_session, sessionmaker, declarative_base
+
+try:
+    # Scope sessions per green thread under the eventlet Celery pool; importing
+    # corolocal does not monkey-patch anything, so this is safe for the API too.
+    from eventlet.corolocal import get_ident as _scope_ident
+except ImportError:
+    from threading import get_ident as _scope_ident
+
+load_dotenv()
 
 MYSQL_USER = "geofence_user"
 MYSQL_PASSWORD = "geofence_pass"
@@ -7,12 +20,57 @@ MYSQL_HOST = "localhost"
 MYSQL_PORT = "3306"
 MYSQL_DB = "geofence_db"
 
-SQLALCHEMY_DATABASE_URL = (
+DEFAULT_DATABASE_URL = (
     f"mysql+pymysql://{MYSQL_USER}:{MYSQL_PASSWORD}@{MYSQL_HOST}:{MYSQL_PORT}/{MYSQL_DB}"
 )
 
-engine = create_engine(SQLALCHEMY_DATABASE_URL, echo=True, future=True)
+# DATABASE_URL from backend/.env wins (as documented in the README), so a
+# deployment can point at another server - e.g. PostgreSQL/PostGIS - without
+# code changes.
+SQLALCHEMY_DATABASE_URL = os.getenv("DATABASE_URL", DEFAULT_DATABASE_URL)
 
-SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+# Persistent pool shared by FastAPI and the Celery workers:
+# - pool_pre_ping replaces connections MySQL closed (wait_timeout) instead of
+#   surfacing "server has gone away" errors
+# - pool_recycle retires connections before MySQL's idle timeout
+# - pool_use_lifo prefers the most recently used connection (warm caches)
+# - echo=False: logging every statement to stderr is a large per-request cost
+engine = create_engine(
+    SQLALCHEMY_DATABASE_URL,
+    pool_size=20,
+    max_overflow=40,
+    pool_pre_ping=True,
+    pool_recycle=1800,
+    pool_use_lifo=True,
+    echo=False,
+    future=True,
+)
+
+# Sync session registry, used by the Celery worker (and create_all). Scoped
+# per green thread so each of the ~100 eventlet tasks reuses one session
+# instead of opening a fresh connection; workers call SessionLocal.remove()
+# after each task (see celery_app).
+SessionLocal = scoped_session(
+    sessionmaker(autocommit=False, autoflush=False, bind=engine),
+    scopefunc=_scope_ident,
+)
+
+# Async engine for the FastAPI routes: a worker blocked on DB I/O yields the
+# event loop instead of occupying one of the ~40 threadpool threads.
+ASYNC_DATABASE_URL = SQLALCHEMY_DATABASE_URL.replace("+pymysql", "+aiomysql")
+
+async_engine = create_async_engine(
+    ASYNC_DATABASE_URL,
+    pool_size=20,
+    max_overflow=40,
+    pool_pre_ping=True,
+    pool_recycle=1800,
+    pool_use_lifo=True,
+    echo=False,
+)
+
+AsyncSessionLocal = async_sessionmaker(
+    async_engine, autoflush=False, expire_on_commit=False
+)
 
 Base = declarative_base()
@@ -0,0 +1,24 @@
+import math
+
+from numba import njit, prange
+
+EARTH_RADIUS_M = 6371000.0
+DEG2RAD = math.pi / 180.0
+
+
+@njit(cache=True, fastmath=True, parallel=True)
+def haversine_batch(lat, lon, lats, lons, out):  # pragma: no cover - compiled
+    """
+    Fills `out` with haversine distances in meters from (lat, lon) to each
+    (lats[i], lons[i]). Unlike the NumPy version this is one fused pass with
+    no intermediate arrays, and prange splits the fences across cores.
+    """
+    phi1 = lat * DEG2RAD
+    cos_phi1 = math.cos(phi1)
+    for i in prange(lats.shape[0]):
+        dphi = (lats[i] - lat) * DEG2RAD * 0.5
+        dlambda = (lons[i] - lon) * DEG2RAD * 0.5
+        sin_dphi = math.sin(dphi)
+        sin_dlambda = math.sin(dlambda)
+        a = sin_dphi * sin_dphi + cos_phi1 * math.cos(lats[i] * DEG2RAD) * sin_dlambda * sin_dlambda
+        out[i] = 2.0 * EARTH_RADIUS_M * math.atan2(math.sqrt(a), math.sqrt(1.0 - a))
@@ -1,27 +1,56 @@
 import math
 from typing import List
 
+import numpy as np
 from fastapi import FastAPI, Depends, HTTPException
-from sqlalchemy.orm import Session
+from fastapi.responses import ORJSONResponse
+from pydantic import BaseModel
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.ext.asyncio import AsyncSession
 
-from .database import Base, engine, SessionLocal
+from .database import Base, engine, AsyncSessionLocal
 from . import models, schemas, crud
 from .celery_app import process_alert_task
+from .spatial_index import (
+    geofence_index,
+    cell_of,
+    neighbor_cells,
+    prune_max_radius_m,
+)
+from .geo_kernels import haversine_batch, EARTH_RADIUS_M
+
+# Below this many candidate fences the NumPy path wins; above it the fused
+# Numba kernel avoids the intermediate arrays and parallelizes across cores.
+NUMBA_MIN_FENCES = 64
+
+# Above this radius the flat-earth approximation drifts too far; fall back to
+# full haversine. Typical geofences are a few km.
+EQUIRECT_MAX_RADIUS_M = 50_000.0
 
 # Create DB tables (dev mode)
 Base.metadata.create_all(bind=engine)
 
-app = FastAPI(title="Geofence MVP")
+# orjson serializes responses several times faster than the default encoder,
+# which matters for the list-heavy profile and alert payloads
+app = FastAPI(title="Geofence MVP", default_response_class=ORJSONResponse)
 
 
 # ---------- DB SESSION DEPENDENCY ----------
 
-def get_db():
-    db = SessionLocal()
-    try:
+async def get_db():
+    async with AsyncSessionLocal() as db:
         yield db
-    finally:
-        db.close()
+
+
+# ---------- HELPER: RESPONSE SHAPING ----------
+
+def _construct(schema: type[BaseModel], row) -> dict:
+    """
+    Trusted ORM row -> plain response dict via model_construct, skipping
+    Pydantic's per-field validator dispatch on the hot read paths. Attributes
+    that aren't schema fields (e.g. SQLAlchemy state) are dropped.
+    """
+    return schema.model_construct(**row.__dict__).model_dump()
 
 
 # ---------- HELPER: HAVERSINE DISTANCE ----------
@@ -42,6 +71,67 @@ def haversine_distance_m(lat1: float, lon1: float, lat2: float, lon2: float) ->
     return R * c
 
 
+def haversine_distance_m_vec(lat: float, lon: float, lats: np.ndarray, lons: np.ndarray) -> np.ndarray:
+    """
+    Vectorized haversine: distances in meters from one point to arrays of points.
+    One NumPy pass replaces a scalar Python call per geofence, which pushes the
+    inner loop (and the trig) into C.
+    """
+    R = 6371000  # Earth radius in meters
+    phi1 = math.radians(lat)
+    phis = np.radians(lats)
+    dphi = np.radians(lats - lat)
+    dlambda = np.radians(lons - lon)
+
+    a = np.sin(dphi / 2) ** 2 + math.cos(phi1) * np.cos(phis) * np.sin(dlambda / 2) ** 2
+    c = 2 * np.arctan2(np.sqrt(a), np.sqrt(1 - a))
+
+    return R * c
+
+
+def _fence_sincos(gf: models.Geofence) -> tuple[float, float]:
+    """
+    (sin, cos) of the fence's center latitude, preferring the values stored
+    at creation time; computed on the fly for rows predating those columns.
+    """
+    if gf.sin_center_lat is not None and gf.cos_center_lat is not None:
+        return gf.sin_center_lat, gf.cos_center_lat
+    phi = math.radians(gf.center_lat)
+    return math.sin(phi), math.cos(phi)
+
+
+def haversine_from_precomputed(
+    lat1: float, lon1: float, lon2: float, sin_phi2: float, cos_phi2: float
+) -> float:
+    """
+    Haversine distance where the second point's sin/cos latitude are already
+    known (stored per geofence). Uses sin^2(x/2) = (1 - cos x)/2 so only three
+    trig calls remain, all for the first point and the longitude delta.
+    """
+    phi1 = math.radians(lat1)
+    sin_phi1 = math.sin(phi1)
+    cos_phi1 = math.cos(phi1)
+    cos_dlambda = math.cos(math.radians(lon2 - lon1))
+
+    a = (1 - sin_phi1 * sin_phi2 - cos_phi1 * cos_phi2) / 2 + cos_phi1 * cos_phi2 * (1 - cos_dlambda) / 2
+    a = min(max(a, 0.0), 1.0)  # guard against rounding just outside [0, 1]
+    return EARTH_RADIUS_M * 2 * math.atan2(math.sqrt(a), math.sqrt(1 - a))
+
+
+def inside_equirect(lat: float, lon: float, center_lat: float, center_lon: float, radius_m: float) -> bool:
+    """
+    Inside/outside test using the equirectangular (flat-earth) approximation.
+    Compares squared planar distance against radius^2, so there is no atan2 or
+    sqrt; error is well under 0.5% for radii up to a few tens of km.
+    """
+    # Normalize the longitude delta into [-180, 180) so fences straddling the
+    # antimeridian measure correctly
+    dlon = (lon - center_lon + 180.0) % 360.0 - 180.0
+    x = math.radians(dlon) * math.cos(math.radians(center_lat))
+    y = math.radians(lat - center_lat)
+    return (x * x + y * y) * EARTH_RADIUS_M * EARTH_RADIUS_M <= radius_m * radius_m
+
+
 # ---------- ROUTES ----------
 
 @app.get("/")
@@ -52,89 +142,151 @@ def read_root():
 # ---- Users ----
 
 @app.post("/users/", response_model=schemas.UserResponse)
-def create_user(user: schemas.UserCreate, db: Session = Depends(get_db)):
+async def create_user(user: schemas.UserCreate, db: AsyncSession = Depends(get_db)):
     """
     Create a simple user (just username for now).
     Required before creating geofences, because geofences.user_id has a FK to users.id.
     """
-    return crud.create_user(db, user)
+    return await crud.create_user(db, user)
 
 
 # ---- Geofences ----
 
 @app.post("/geofences/", response_model=schemas.GeofenceResponse)
-def create_geofence(geofence: schemas.GeofenceCreate, db: Session = Depends(get_db)):
+async def create_geofence(geofence: schemas.GeofenceCreate, db: AsyncSession = Depends(get_db)):
     """
     Create a circular geofence for a given user.
     Validates that the user exists to avoid foreign key errors.
     """
-    db_user = crud.get_user(db, geofence.user_id)
-    if not db_user:
+    if not await crud.user_exists(db, geofence.user_id):
         raise HTTPException(status_code=404, detail="User not found")
 
-    return crud.create_geofence(db, geofence)
+    db_geofence = await crud.create_geofence(db, geofence)
+
+    # Drop the cached spatial index so the next location update picks up the new fence
+    geofence_index.invalidate(geofence.user_id)
+
+    return db_geofence
 
 
 # ---- Device registration ----
 
 @app.post("/devices/register", response_model=schemas.DeviceResponse)
-def register_device(device: schemas.DeviceRegister, db: Session = Depends(get_db)):
+async def register_device(device: schemas.DeviceRegister, db: AsyncSession = Depends(get_db)):
     """
     Register or update a device's FCM token for a user.
     The mobile app should call this after it gets an FCM token from Firebase.
     """
-    db_user = crud.get_user(db, device.user_id)
-    if not db_user:
+    if not await crud.user_exists(db, device.user_id):
         raise HTTPException(status_code=404, detail="User not found")
 
-    return crud.register_device(db, device)
+    return await crud.register_device(db, device)
 
 
 # ---- Location Updates & Geofence Check ----
 
 @app.post("/location/update", response_model=schemas.LocationCheckResult)
-def update_location(location: schemas.LocationUpdate, db: Session = Depends(get_db)):
+async def update_location(location: schemas.LocationUpdate, db: AsyncSession = Depends(get_db)):
     """
-    Save or update the user's latest location and check against their geofence.
-    For now:
-      - Uses the first geofence for the user (if multiple exist).
-      - Returns inside/outside, distance, and a basic alert flag (alert if outside).
+    Save or update the user's latest location and check against all of their geofences.
+      - An R-tree of fence bounding boxes prunes the fences that need an exact
+        haversine check, so only fences whose box contains the point are measured.
+      - Returns inside/outside, distance to the nearest fence center, and a basic
+        alert flag (alert when outside every geofence).
       - If alert is true, we enqueue a background task to log an Alert + send push.
     """
-    # Ensure user exists
-    db_user = crud.get_user(db, location.user_id)
-    if not db_user:
+    # Persist latest location first; the FK on user_locations.user_id doubles
+    # as the existence check, so no separate SELECT against users is needed.
+    try:
+        await crud.upsert_user_location(db, location)
+    except IntegrityError:
+        await db.rollback()
         raise HTTPException(status_code=404, detail="User not found")
 
-    # Persist latest location
-    crud.upsert_user_location(db, location)
-
     # Get user's geofences
-    geofences = crud.get_user_geofences(db, location.user_id)
+    geofences = await crud.get_user_geofences(db, location.user_id)
     if not geofences:
         raise HTTPException(status_code=400, detail="User has no geofences configured")
 
-    # For now, just use the first geofence
-    gf = geofences[0]
-
-    distance = haversine_distance_m(
-        location.lat,
-        location.lon,
-        gf.center_lat,
-        gf.center_lon,
+    # Prefilter with the bounding-box index plus the geohash bucket: a fence
+    # can only contain the point if its box does, and a small fence (radius
+    # within the cell-block guarantee, which shrinks with latitude as cells
+    # narrow) only if its center cell is in the 3x3 block around the point's
+    # cell. Oversized fences and rows predating the geohash6 column are never
+    # pruned by cell. When nothing survives we still scan all fences once so
+    # the nearest distance can be reported.
+    candidate_ids = geofence_index.candidate_ids(
+        location.user_id, geofences, location.lat, location.lon
+    )
+    # Only build the cell block when pruning is enabled: near the poles the
+    # safe radius collapses to <= 0 (every fence bypasses the cell test) and
+    # the top/bottom geohash rows have no polar neighbors, so neighbor_cells
+    # would raise there.
+    prune_radius = prune_max_radius_m(location.lat)
+    cells = (
+        neighbor_cells(cell_of(location.lat, location.lon))
+        if prune_radius > 0
+        else frozenset()
+    )
+    candidates = [
+        gf
+        for gf in geofences
+        if gf.id in candidate_ids
+        and (
+            gf.geohash6 is None
+            or gf.radius_m > prune_radius
+            or gf.geohash6 in cells
+        )
+    ] or geofences
+
+    n = len(candidates)
+    centers_lat = np.fromiter((gf.center_lat for gf in candidates), dtype=np.float64, count=n)
+    centers_lon = np.fromiter((gf.center_lon for gf in candidates), dtype=np.float64, count=n)
+    radii = np.fromiter((gf.radius_m for gf in candidates), dtype=np.float64, count=n)
+
+    if float(radii.max()) <= EQUIRECT_MAX_RADIUS_M:
+        # Equirectangular approximation, vectorized: squared planar distance
+        # against radius^2 - a pure FMA loop with no per-fence trig at all,
+        # since cos(center_lat) was computed when each fence was created.
+        # Exact haversine is only paid once below, for the reported nearest
+        # distance.
+        cos_lats = np.fromiter((_fence_sincos(gf)[1] for gf in candidates), dtype=np.float64, count=n)
+        # Normalize longitude deltas into [-180, 180) so fences straddling
+        # the antimeridian measure correctly
+        dlon = (centers_lon - location.lon + 180.0) % 360.0 - 180.0
+        x = np.radians(dlon) * cos_lats
+        y = np.radians(centers_lat - location.lat)
+        d2 = (x * x + y * y) * (EARTH_RADIUS_M * EARTH_RADIUS_M)
+        inside_mask = d2 <= radii * radii
+        nearest_idx = int(d2.argmin())
+    else:
+        if n > NUMBA_MIN_FENCES:
+            distances = np.empty(n, dtype=np.float64)
+            haversine_batch(location.lat, location.lon, centers_lat, centers_lon, distances)
+        else:
+            distances = haversine_distance_m_vec(location.lat, location.lon, centers_lat, centers_lon)
+        inside_mask = distances <= radii
+        nearest_idx = int(distances.argmin())
+
+    inside = bool(inside_mask.any())
+    nearest_gf = candidates[nearest_idx]
+    # Exact distance only for the single fence we report back, reusing its
+    # stored sin/cos
+    nearest_sin, nearest_cos = _fence_sincos(nearest_gf)
+    nearest_distance = haversine_from_precomputed(
+        location.lat, location.lon, nearest_gf.center_lon, nearest_sin, nearest_cos
     )
 
-    inside = distance <= gf.radius_m
-    alert = not inside  # basic rule: alert when outside
+    alert = not inside  # basic rule: alert when outside every geofence
 
     # If outside, enqueue background task to log alert and send push
     if alert:
         message = "User is outside geofenced area"
-        process_alert_task.delay(location.user_id, gf.id, message)
+        process_alert_task.delay(location.user_id, nearest_gf.id, message)
 
     return schemas.LocationCheckResult(
         inside=inside,
-        distance_m=distance,
+        distance_m=nearest_distance,
         alert=alert,
     )
 
@@ -142,26 +294,27 @@ def update_location(location: schemas.LocationUpdate, db: Session = Depends(get_
 # ---- Alerts ----
 
 @app.get("/alerts/", response_model=List[schemas.AlertResponse])
-def list_alerts(limit: int = 100, db: Session = Depends(get_db)):
+async def list_alerts(limit: int = 100, db: AsyncSession = Depends(get_db)):
     """
     List recent alerts (for debugging / admin).
     """
-    return crud.get_alerts(db, limit=limit)
+    alerts = await crud.get_alerts(db, limit=limit)
+    return ORJSONResponse([_construct(schemas.AlertResponse, alert) for alert in alerts])
 
 
 @app.get("/users/{user_id}/alerts", response_model=List[schemas.AlertResponse])
-def list_user_alerts(user_id: int, limit: int = 100, db: Session = Depends(get_db)):
+async def list_user_alerts(user_id: int, limit: int = 100, db: AsyncSession = Depends(get_db)):
     """
     List recent alerts for a specific user.
     """
-    db_user = crud.get_user(db, user_id)
-    if not db_user:
+    if not await crud.user_exists(db, user_id):
         raise HTTPException(status_code=404, detail="User not found")
 
-    return crud.get_alerts_for_user(db, user_id=user_id, limit=limit)
+    alerts = await crud.get_alerts_for_user(db, user_id=user_id, limit=limit)
+    return ORJSONResponse([_construct(schemas.AlertResponse, alert) for alert in alerts])
 
 @app.get("/users/{user_id}/profile", response_model=schemas.UserProfileResponse)
-def get_user_profile(user_id: int, db: Session = Depends(get_db)):
+async def get_user_profile(user_id: int, db: AsyncSession = Depends(get_db)):
     """
     Return full user information:
       - basic user details
@@ -170,20 +323,28 @@ def get_user_profile(user_id: int, db: Session = Depends(get_db)):
       - last known location (if any)
       - recent alerts
     """
-    db_user = crud.get_user(db, user_id)
+    # User, geofences, devices and locations come back in one batched query
+    # group; alerts keep their own query because of the limit/ordering.
+    db_user = await crud.get_user_with_profile(db, user_id)
     if not db_user:
         raise HTTPException(status_code=404, detail="User not found")
 
-    geofences = crud.get_user_geofences(db, user_id=user_id)
-    devices = crud.get_devices_for_user(db, user_id=user_id)
-    last_location = crud.get_last_location_for_user(db, user_id=user_id)
-    alerts = crud.get_alerts_for_user(db, user_id=user_id, limit=50)
-
-    return schemas.UserProfileResponse(
-        user=db_user,
-        geofences=geofences,
-        devices=devices,
-        last_location=last_location,
-        alerts=alerts,
+    # user_locations holds at most one row per user (unique user_id)
+    last_location = db_user.locations[0] if db_user.locations else None
+    alerts = await crud.get_alerts_for_user(db, user_id=user_id, limit=50)
+
+    # Shape the response with model_construct: the rows came straight from
+    # the ORM, so re-validating potentially hundreds of them per profile
+    # fetch buys nothing.
+    return ORJSONResponse(
+        {
+            "user": _construct(schemas.UserResponse, db_user),
+            "geofences": [_construct(schemas.GeofenceResponse, gf) for gf in db_user.geofences],
+            "devices": [_construct(schemas.DeviceResponse, d) for d in db_user.devices],
+            "last_location": _construct(schemas.UserLocationResponse, last_location)
+            if last_location
+            else None,
+            "alerts": [_construct(schemas.AlertResponse, alert) for alert in alerts],
+        }
     )
 
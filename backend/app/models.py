@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, String, Float, ForeignKey, DateTime, func
+from sqlalchemy import Column, Index, Integer, String, Float, ForeignKey, DateTime, func
 from sqlalchemy.orm import relationship
 
 from .database import Base
@@ -25,6 +25,17 @@ class Geofence(Base):
     center_lon = Column(Float, nullable=False)
     radius_m = Column(Float, nullable=False)
 
+    # sin/cos of center_lat, computed once at creation. center_lat never
+    # changes, so storing these saves two trig calls per distance evaluation
+    # in the location hot loop. Nullable for rows predating the columns.
+    sin_center_lat = Column(Float, nullable=True)
+    cos_center_lat = Column(Float, nullable=True)
+
+    # Geohash of the center at pruning precision; indexed so deployments with
+    # too many fences to load per user can bucket the candidate fetch with a
+    # WHERE geohash6 IN (...) clause. Nullable for rows predating the column.
+    geohash6 = Column(String(6), index=True, nullable=True)
+
     user = relationship("User", back_populates="geofences")
 
 
@@ -32,7 +43,9 @@ class UserLocation(Base):
     __tablename__ = "user_locations"
 
     id = Column(Integer, primary_key=True, index=True)
-    user_id = Column(Integer, ForeignKey("users.id"), nullable=False)
+    # One row per user; the unique index lets INSERT ... ON DUPLICATE KEY UPDATE
+    # upsert the latest location in a single statement.
+    user_id = Column(Integer, ForeignKey("users.id"), nullable=False, unique=True)
     lat = Column(Float, nullable=False)
     lon = Column(Float, nullable=False)
     updated_at = Column(
@@ -63,7 +76,9 @@ class Device(Base):
     id = Column(Integer, primary_key=True, index=True)
     user_id = Column(Integer, ForeignKey("users.id"), nullable=False)
     platform = Column(String(20), nullable=False)  # e.g. "android", "ios", "web"
-    fcm_token = Column(String(255), nullable=False)
+    # Unique: register_device upserts on fcm_token, and the unique index also
+    # serves its lookup
+    fcm_token = Column(String(255), nullable=False, unique=True)
     created_at = Column(DateTime(timezone=True), server_default=func.now())
     updated_at = Column(
         DateTime(timezone=True),
@@ -72,3 +87,12 @@ class Device(Base):
     )
 
     user = relationship("User", back_populates="devices")
+
+
+# Composite/FK indexes for the hot queries: each filters on user_id and, for
+# alerts, orders by created_at DESC - the composite index serves both without
+# a filesort. UserLocation needs nothing extra: its unique user_id index
+# already covers lookup and upsert.
+Index("ix_alerts_user_created", Alert.user_id, Alert.created_at.desc())
+Index("ix_devices_user", Device.user_id)
+Index("ix_geofences_user", Geofence.user_id)
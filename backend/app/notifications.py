@@ -1,7 +1,12 @@
 import os
 import json
-from typing import Dict, Any
+import threading
+from datetime import datetime, timedelta
+from typing import Dict, Any, List
 
+import eventlet
+import httpx
+import orjson
 import requests
 from dotenv import load_dotenv
 from google.oauth2 import service_account
@@ -15,47 +20,77 @@ SERVICE_ACCOUNT_FILE = os.getenv("FCM_SERVICE_ACCOUNT_FILE")
 if not SERVICE_ACCOUNT_FILE:
     print("WARNING: FCM_SERVICE_ACCOUNT_FILE is not set. Push notifications will not work.")
 
-
-def _get_fcm_access_token() -> str | None:
-    """
-    Uses the service account JSON to obtain an OAuth2 access token
-    with the firebase.messaging scope.
-    """
-    if not SERVICE_ACCOUNT_FILE or not os.path.exists(SERVICE_ACCOUNT_FILE):
-        print("Service account file not found. Cannot obtain FCM access token.")
-        return None
-
-    scopes = ["https://www.googleapis.com/auth/firebase.messaging"]
-
+# Per-request timeout for FCM sends
+FCM_TIMEOUT_S = 15
+
+# Shared session so successive sends reuse the same keep-alive HTTPS connection
+# instead of paying a TCP + TLS handshake per request. The pool is sized for
+# the eventlet worker (concurrency ~100) so concurrent sends don't serialize
+# on a handful of sockets.
+_session = requests.Session()
+_adapter = requests.adapters.HTTPAdapter(pool_connections=10, pool_maxsize=100)
+_session.mount("https://", _adapter)
+
+# Sync HTTP/2 client for batch sends. It is thread- and greenlet-safe, so
+# concurrent sends multiplex over a shared keep-alive connection; under the
+# monkey-patched eventlet worker its sockets are cooperative, which is where
+# the batch concurrency comes from (no asyncio - a green thread cannot own an
+# asyncio event loop without colliding with its neighbors').
+_http2_client = httpx.Client(
+    http2=True,
+    timeout=FCM_TIMEOUT_S,
+    limits=httpx.Limits(max_keepalive_connections=50),
+)
+
+# Fan-out pool for per-token sends within a batch. In an unpatched process
+# the greenlets just run sequentially, which is still correct.
+_send_pool = eventlet.greenpool.GreenPool(100)
+
+
+_FCM_SCOPES = ["https://www.googleapis.com/auth/firebase.messaging"]
+
+# Credentials and project_id are pure functions of the service account file,
+# so both are loaded once at import time instead of once per notification.
+_PROJECT_ID: str | None = None
+_credentials: service_account.Credentials | None = None
+_token_lock = threading.Lock()
+
+if SERVICE_ACCOUNT_FILE and os.path.exists(SERVICE_ACCOUNT_FILE):
     try:
-        credentials = service_account.Credentials.from_service_account_file(
+        with open(SERVICE_ACCOUNT_FILE, "r", encoding="utf-8") as f:
+            _PROJECT_ID = json.load(f).get("project_id")
+        _credentials = service_account.Credentials.from_service_account_file(
             SERVICE_ACCOUNT_FILE,
-            scopes=scopes,
+            scopes=_FCM_SCOPES,
         )
-        # Refresh to get token
-        auth_req = GoogleRequest()
-        credentials.refresh(auth_req)
-        return credentials.token
     except Exception as e:
-        print(f"Error getting FCM access token: {e}")
-        return None
+        print(f"Error loading FCM service account: {e}")
 
 
-def _get_project_id_from_service_account() -> str | None:
+def _get_cached_token() -> str | None:
     """
-    Reads the project_id from the service account JSON file.
+    Returns the cached OAuth2 access token for the firebase.messaging scope,
+    refreshing it (RSA-signed JWT + round trip to oauth2.googleapis.com) only
+    when it is missing or within 60 seconds of expiry. Tokens are valid for
+    roughly an hour, so almost every send reuses the cached string.
     """
-    if not SERVICE_ACCOUNT_FILE or not os.path.exists(SERVICE_ACCOUNT_FILE):
-        print("Service account file not found. Cannot read project_id.")
+    if _credentials is None:
+        print("Service account not loaded. Cannot obtain FCM access token.")
         return None
 
-    try:
-        with open(SERVICE_ACCOUNT_FILE, "r", encoding="utf-8") as f:
-            data = json.load(f)
-        return data.get("project_id")
-    except Exception as e:
-        print(f"Error reading project_id from service account: {e}")
-        return None
+    with _token_lock:
+        expiry = _credentials.expiry
+        if (
+            not _credentials.token
+            or expiry is None
+            or datetime.utcnow() > expiry - timedelta(seconds=60)
+        ):
+            try:
+                _credentials.refresh(GoogleRequest())
+            except Exception as e:
+                print(f"Error refreshing FCM access token: {e}")
+                return None
+        return _credentials.token
 
 
 def send_fcm_notification(token: str, title: str, body: str, data: Dict[str, Any] | None = None) -> bool:
@@ -64,12 +99,12 @@ def send_fcm_notification(token: str, title: str, body: str, data: Dict[str, Any
     Returns True on success, False otherwise.
     """
 
-    project_id = _get_project_id_from_service_account()
+    project_id = _PROJECT_ID
     if not project_id:
         print("No project_id available. Cannot send FCM notification.")
         return False
 
-    access_token = _get_fcm_access_token()
+    access_token = _get_cached_token()
     if not access_token:
         print("No access token available. Cannot send FCM notification.")
         return False
@@ -98,7 +133,7 @@ def send_fcm_notification(token: str, title: str, body: str, data: Dict[str, Any
     }
 
     try:
-        response = requests.post(url, headers=headers, data=json.dumps(payload), timeout=10)
+        response = _session.post(url, headers=headers, data=orjson.dumps(payload), timeout=10)
         if response.status_code == 200:
             return True
         else:
@@ -108,3 +143,76 @@ def send_fcm_notification(token: str, title: str, body: str, data: Dict[str, Any
         print(f"Error sending FCM v1 notification: {e}")
         return False
 
+
+def _build_message_json(token: str, title: str, body: str, data_str: Dict[str, str]) -> bytes:
+    """
+    Builds the JSON body of a single FCM v1 `messages:send` request.
+    orjson encodes straight to bytes, several times faster than stdlib json -
+    measurable when a batch builds hundreds of payloads.
+    """
+    payload: Dict[str, Any] = {
+        "message": {
+            "token": token,
+            "notification": {
+                "title": title,
+                "body": body,
+            },
+            "data": data_str,
+        }
+    }
+    return orjson.dumps(payload)
+
+
+def _send_one(url: str, headers: Dict[str, str], content: bytes) -> bool:
+    """
+    Posts a single messages:send request on the shared HTTP/2 client.
+    """
+    try:
+        response = _http2_client.post(url, headers=headers, content=content)
+        if response.status_code != 200:
+            print(f"FCM v1 error {response.status_code}: {response.text}")
+        return response.status_code == 200
+    except Exception as e:
+        print(f"Error sending FCM v1 notification: {e}")
+        return False
+
+
+def send_fcm_notifications_batch(
+    tokens: List[str], title: str, body: str, data: Dict[str, Any] | None = None
+) -> int:
+    """
+    Sends the same notification to many devices concurrently on green
+    threads, multiplexed over the shared HTTP/2 connection, so the OAuth2
+    token lookup and the TLS handshake are paid once per batch instead of
+    once per device. Returns the number of sends FCM accepted.
+    """
+    if not tokens:
+        return 0
+
+    project_id = _PROJECT_ID
+    if not project_id:
+        print("No project_id available. Cannot send FCM notifications.")
+        return 0
+
+    access_token = _get_cached_token()
+    if not access_token:
+        print("No access token available. Cannot send FCM notifications.")
+        return 0
+
+    # 🔴 FCM requires ALL data values to be strings
+    data_str: Dict[str, str] = {}
+    if data:
+        data_str = {str(k): str(v) for k, v in data.items()}
+
+    url = f"https://fcm.googleapis.com/v1/projects/{project_id}/messages:send"
+    headers = {
+        "Content-Type": "application/json",
+        "Authorization": f"Bearer {access_token}",
+    }
+
+    results = _send_pool.imap(
+        lambda token: _send_one(url, headers, _build_message_json(token, title, body, data_str)),
+        tokens,
+    )
+    return sum(1 for ok in results if ok)
+
@@ -0,0 +1,128 @@
+import math
+import threading
+
+import pygeohash
+from rtree import index
+
+# A precision-6 cell spans 0.0054932 deg of latitude (~611 m everywhere) and
+# 0.0109863 deg of longitude, whose metric width shrinks by cos(lat). A point
+# can only fall inside a fence whose center lies in the 3x3 cell block around
+# it when the fence radius is below one cell dimension - so the safe pruning
+# radius depends on latitude and larger fences must always be kept.
+GEOHASH_PRECISION = 6
+GEOHASH_CELL_LAT_M = 611.0  # cell height, constant
+GEOHASH_CELL_LON_M = 1223.0  # cell width at the equator
+GEOHASH_PRUNE_MARGIN_M = 10.0
+
+
+def prune_max_radius_m(lat: float) -> float:
+    """
+    Largest fence radius that is safe to prune by cell membership at this
+    latitude. Above ~60 deg the cell width drops below the cell height and
+    becomes the binding constraint; near the poles this goes to zero (or
+    negative), which disables cell pruning entirely.
+    """
+    cell_width = GEOHASH_CELL_LON_M * math.cos(math.radians(lat))
+    return min(GEOHASH_CELL_LAT_M, cell_width) - GEOHASH_PRUNE_MARGIN_M
+
+
+def cell_of(lat: float, lon: float) -> str:
+    """Geohash cell of a point at the pruning precision."""
+    return pygeohash.encode(lat, lon, precision=GEOHASH_PRECISION)
+
+
+def neighbor_cells(cell: str) -> set[str]:
+    """The cell plus its 8 neighbors."""
+    left = pygeohash.get_adjacent(cell, "left")
+    right = pygeohash.get_adjacent(cell, "right")
+    top = pygeohash.get_adjacent(cell, "top")
+    bottom = pygeohash.get_adjacent(cell, "bottom")
+    return {
+        cell,
+        left,
+        right,
+        top,
+        bottom,
+        pygeohash.get_adjacent(top, "left"),
+        pygeohash.get_adjacent(top, "right"),
+        pygeohash.get_adjacent(bottom, "left"),
+        pygeohash.get_adjacent(bottom, "right"),
+    }
+
+
+def _bounding_boxes(center_lat: float, center_lon: float, radius_m: float) -> list[tuple[float, float, float, float]]:
+    """
+    Returns the (min_lon, min_lat, max_lon, max_lat) bounding box around a
+    circular geofence. One degree of latitude is ~111320 m; longitude degrees
+    shrink by cos(latitude). A box that straddles the antimeridian is split
+    into two, one on each side of +/-180, so a point query near the seam
+    still hits it.
+    """
+    dphi = radius_m / 111320.0
+    cos_lat = math.cos(math.radians(center_lat))
+    # Guard against division by zero for fences at the poles.
+    dlambda = radius_m / (111320.0 * max(cos_lat, 1e-6))
+
+    min_lat = max(center_lat - dphi, -90.0)
+    max_lat = min(center_lat + dphi, 90.0)
+    min_lon = center_lon - dlambda
+    max_lon = center_lon + dlambda
+
+    if min_lon < -180.0:
+        return [
+            (min_lon + 360.0, min_lat, 180.0, max_lat),
+            (-180.0, min_lat, max_lon, max_lat),
+        ]
+    if max_lon > 180.0:
+        return [
+            (min_lon, min_lat, 180.0, max_lat),
+            (-180.0, min_lat, max_lon - 360.0, max_lat),
+        ]
+    return [(min_lon, min_lat, max_lon, max_lat)]
+
+
+class GeofenceIndex:
+    """
+    In-memory R-tree of geofence bounding boxes, one index per user.
+
+    A point query against the R-tree returns only the fences whose bounding
+    box contains the point, so the exact haversine check runs on O(log N)
+    candidates instead of every fence the user owns. Indexes are built lazily
+    from the fences already loaded for the request and dropped via
+    invalidate() whenever a user's geofences change.
+    """
+
+    def __init__(self) -> None:
+        self._indexes: dict[int, index.Index] = {}
+        self._lock = threading.Lock()
+
+    def _build(self, geofences) -> index.Index:
+        idx = index.Index()
+        for gf in geofences:
+            for box in _bounding_boxes(gf.center_lat, gf.center_lon, gf.radius_m):
+                idx.insert(gf.id, box)
+        return idx
+
+    def candidate_ids(self, user_id: int, geofences, lat: float, lon: float) -> set[int]:
+        """
+        Returns the ids of the user's geofences whose bounding box contains
+        the given point. Builds the user's index from `geofences` on first use.
+        """
+        with self._lock:
+            idx = self._indexes.get(user_id)
+            if idx is None:
+                idx = self._build(geofences)
+                self._indexes[user_id] = idx
+        return set(idx.intersection((lon, lat, lon, lat)))
+
+    def invalidate(self, user_id: int) -> None:
+        """
+        Drops the cached index for a user. Call after creating/deleting a
+        geofence so the next location update rebuilds it.
+        """
+        with self._lock:
+            self._indexes.pop(user_id, None)
+
+
+# Shared index instance used by the API endpoints.
+geofence_index = GeofenceIndex()
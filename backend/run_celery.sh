@@ -0,0 +1,8 @@
+#!/usr/bin/env bash
+# Starts the Celery worker with the eventlet pool. process_alert_task is
+# almost entirely network I/O (MySQL + FCM), so one worker process can
+# multiplex ~100 concurrent tasks on green threads instead of forking a
+# process per task.
+cd "$(dirname "$0")"
+# -B embeds the beat scheduler that drives the flush_alerts task.
+exec celery -A app.celery_app:celery_app worker -B --pool=eventlet --concurrency=100 --loglevel=INFO